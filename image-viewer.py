@@ -2,16 +2,48 @@ import sys
 import os
 import json
 import logging
+import collections
+import threading
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, QSizePolicy, QDesktopWidget, QComboBox, QSlider
-from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtCore import Qt, QTimer, QRect, QDir
-from PIL import Image
+from PyQt5.QtGui import QPixmap, QImageReader, QImageIOHandler
+from PyQt5.QtCore import Qt, QTimer, QRect, QDir, QSize, QRunnable, QThreadPool
 
 CONFIG_FILE = 'image_viewer_config.json'
+EXTS_SET = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+PIXMAP_CACHE_SIZE = 32
+SCREEN_CHECK_DISTANCE = 50
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def read_scaled_image(image_path, target):
+    # Safe to call off the GUI thread: only QImage is touched, never QPixmap
+    reader = QImageReader(image_path)
+    reader.setAutoTransform(True)
+    # The scaled size applies before the EXIF rotation, so fit the
+    # un-rotated image into the transposed label
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        target = target.transposed()
+    size = reader.size()
+    if size.isValid():
+        # Let the format plugin decode straight at display resolution
+        reader.setScaledSize(size.scaled(target, Qt.KeepAspectRatio))
+    qimg = reader.read()
+    if qimg.isNull():
+        logging.error(f"Error reading image {image_path}: {reader.errorString()}")
+    return qimg
+
+class PrefetchTask(QRunnable):
+    def __init__(self, viewer, key):
+        super().__init__()
+        self.viewer = viewer
+        self.key = key
+
+    def run(self):
+        image_path, width, height = self.key
+        qimg = read_scaled_image(image_path, QSize(width, height))
+        self.viewer.store_prefetched(self.key, qimg)
+
 class ImageViewer(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -25,6 +57,7 @@ class ImageViewer(QMainWindow):
             logging.debug("Setting up desktop and geometry")
             self.desktop = QDesktopWidget()
             self.validate_and_set_geometry()
+            self.update_screen_number()
 
             logging.debug("Setting up UI components")
             self.setup_ui()
@@ -32,6 +65,25 @@ class ImageViewer(QMainWindow):
             logging.debug("Setting up timers")
             self.setup_timers()
 
+            # Scaled pixmaps keyed by (path, label width, label height), oldest first
+            self._pixmap_cache = collections.OrderedDict()
+
+            # The decoded image behind the label, rescaled in place on resize
+            self._source_qimage = None
+            self._source_path = None
+            # Label size of the last full-quality render, None after a fast preview
+            self._last_label_size = None
+            # The deferred first-paint reload in showEvent runs only once
+            self._initial_show_done = False
+
+            # Neighbour images decoded on the thread pool, guarded by _prefetch_lock
+            self._pool = QThreadPool.globalInstance()
+            self._prefetch_lock = threading.Lock()
+            self._prefetched = {}
+            self._prefetch_pending = set()
+            # Paths that failed to decode, so they aren't handed to the pool again
+            self._prefetch_failed = set()
+
             logging.debug("Loading images")
             if self.last_folder and os.path.isdir(self.last_folder):
                 self.load_images(self.last_folder)
@@ -53,18 +105,26 @@ class ImageViewer(QMainWindow):
                 return json.load(f)
         return {}
 
-    def save_config(self):
-        logging.debug("Saving configuration")
+    def _do_save_config(self):
         config = {
             'last_folder': self.last_folder,
             'window_geometry': [self.x(), self.y(), self.width(), self.height()],
             'current_slide': self.current_image,
             'slide_direction': self.slideshow_direction,
             'slide_delay': self.slide_delay,
-            'screen_number': self.desktop.screenNumber(self)
+            'screen_number': self._screen_number
         }
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f)
+        if config == self._last_saved_config:
+            return
+        logging.debug("Saving configuration")
+        # Serialize up front and swap the file in whole, so a crash mid-write
+        # can't leave a truncated config behind
+        payload = json.dumps(config, separators=(',', ':')).encode()
+        tmp = CONFIG_FILE + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, CONFIG_FILE)
+        self._last_saved_config = config
 
     def setup_ui(self):
         self.central_widget = QWidget()
@@ -129,10 +189,24 @@ class ImageViewer(QMainWindow):
         self.slideshow_direction = self.config.get('slide_direction', 1)
         self.slide_delay = self.config.get('slide_delay', 4000)
 
+        # Fast previews while _resizing, one smooth pass when the timer fires
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(50)
+        self._resize_timer.timeout.connect(self._finish_resize)
+        self._resizing = False
+
         self.slider_timer = QTimer(self)
         self.slider_timer.setSingleShot(True)
         self.slider_timer.timeout.connect(self.update_image_after_slider)
 
+        # Coalesce config writes from moves, resizes and slide changes
+        self._last_saved_config = self.config
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(500)
+        self._save_timer.timeout.connect(self._do_save_config)
+
         self.delay_combo.setCurrentIndex((self.slide_delay // 1000) - 1)
 
     def validate_and_set_geometry(self):
@@ -157,6 +231,12 @@ class ImageViewer(QMainWindow):
         else:
             self.set_default_geometry()
 
+    def update_screen_number(self):
+        # screenNumber can be a display-server round trip; moveEvent only
+        # refreshes this after the window has travelled SCREEN_CHECK_DISTANCE
+        self._screen_number = self.desktop.screenNumber(self)
+        self._last_screen_check_pos = self.pos()
+
     def set_default_geometry(self):
         screen = self.desktop.screenGeometry()
         width = int(screen.width() * 0.8)
@@ -178,32 +258,64 @@ class ImageViewer(QMainWindow):
         if folder:
             self.load_images(folder)
             self.last_folder = folder
-            self.save_config()
+            self._save_timer.start()
 
     def load_images(self, folder):
-        self.images = []
-        for filename in os.listdir(folder):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                self.images.append(os.path.join(folder, filename))
+        self._pixmap_cache.clear()
+        self._source_qimage = None
+        self._source_path = None
+        self._last_label_size = None
+        with self._prefetch_lock:
+            self._prefetched.clear()
+            self._prefetch_failed.clear()
+        with os.scandir(folder) as it:
+            # Slice off the suffix (rfind is -1 when there is no dot, leaving a
+            # single character that never matches) and lowercase only that
+            self.images = [e.path for e in it
+                           if e.name[e.name.rfind('.'):].lower() in EXTS_SET and e.is_file()]
+        # scandir order is filesystem-dependent; keep the saved slide index stable
+        self.images.sort(key=lambda p: os.path.basename(p).lower())
+        self.slide_slider.blockSignals(True)
         if self.images:
             self.current_image = min(self.current_image, len(self.images) - 1)
             self.slide_slider.setRange(0, len(self.images) - 1)
             self.slide_slider.setValue(self.current_image)
-            self.show_current_image()
         else:
             self.slide_slider.setRange(0, 0)
+        self.slide_slider.blockSignals(False)
+        if self.images:
+            self.show_current_image()
         self.update_dir_label()
 
     def show_image(self, image_path):
-        with Image.open(image_path) as img:
-            img = img.convert("RGBA")
-            data = img.tobytes("raw", "RGBA")
-            qimg = QImage(data, img.width, img.height, QImage.Format_RGBA8888)
+        key = (image_path, self.image_label.width(), self.image_label.height())
+        pixmap = self._pixmap_cache.get(key)
+        if pixmap is not None:
+            self._pixmap_cache.move_to_end(key)
+            # Recovered from the label only if a resize actually needs it
+            self._source_qimage = None
+        else:
+            with self._prefetch_lock:
+                qimg = self._prefetched.pop(key, None)
+            if qimg is None:
+                qimg = read_scaled_image(image_path, self.image_label.size())
+            if qimg.isNull():
+                self._source_qimage = None
+                self._source_path = None
+                self._last_label_size = None
+                self.image_label.setText("Unable to load image")
+                self.update_file_label(image_path)
+                self.update_slide_number_label()
+                return
+            self._source_qimage = qimg
             pixmap = QPixmap.fromImage(qimg)
-            
-            scaled_pixmap = pixmap.scaled(self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.image_label.setPixmap(scaled_pixmap)
-        
+            self._pixmap_cache[key] = pixmap
+            if len(self._pixmap_cache) > PIXMAP_CACHE_SIZE:
+                self._pixmap_cache.popitem(last=False)
+        self._source_path = image_path
+        self._last_label_size = self.image_label.size()
+        self.image_label.setPixmap(pixmap)
+
         self.update_file_label(image_path)
         self.update_slide_number_label()
 
@@ -211,6 +323,34 @@ class ImageViewer(QMainWindow):
         if self.images and 0 <= self.current_image < len(self.images):
             self.show_image(self.images[self.current_image])
             self.slide_slider.setValue(self.current_image)
+            self.prefetch_neighbours()
+
+    def prefetch_neighbours(self):
+        # Before the first show the label still has its pre-layout size
+        if len(self.images) < 2 or not self.isVisible():
+            return
+        size = (self.image_label.width(), self.image_label.height())
+        wanted = {(self.images[(self.current_image + step) % len(self.images)],) + size for step in (1, -1)}
+        keys = wanted - self._pixmap_cache.keys()
+        with self._prefetch_lock:
+            # Drop results for images the viewer has moved away from
+            for key in list(self._prefetched):
+                if key not in wanted:
+                    del self._prefetched[key]
+            keys -= self._prefetch_pending | self._prefetched.keys()
+            keys = {key for key in keys if key[0] not in self._prefetch_failed}
+            self._prefetch_pending |= keys
+        for key in keys:
+            self._pool.start(PrefetchTask(self, key))
+
+    def store_prefetched(self, key, qimg):
+        # Called from the pool's worker threads
+        with self._prefetch_lock:
+            self._prefetch_pending.discard(key)
+            if qimg.isNull():
+                self._prefetch_failed.add(key[0])
+            else:
+                self._prefetched[key] = qimg
 
     def show_next_image(self):
         if self.images:
@@ -227,7 +367,7 @@ class ImageViewer(QMainWindow):
             self.current_image = (self.current_image + self.slideshow_direction) % len(self.images)
             self.show_current_image()
         self.update_direction_label()
-        self.save_config()
+        self._save_timer.start()
 
     def toggle_slideshow(self):
         if self.slideshow_running:
@@ -264,7 +404,7 @@ class ImageViewer(QMainWindow):
         if self.slideshow_running:
             self.timer.stop()
             self.timer.start(self.slide_delay)
-        self.save_config()
+        self._save_timer.start()
 
     def slider_moved(self, value):
         self.slider_timer.stop()
@@ -280,25 +420,66 @@ class ImageViewer(QMainWindow):
             if new_index != self.current_image:
                 self.current_image = new_index
                 self.show_current_image()
-                self.save_config()
+                self._save_timer.start()
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
+        # Cheap previews while the drag is live; one smooth pass once it settles
+        self._resizing = True
         self.update_image_display()
-        self.save_config()
+        self._resize_timer.start()
+        self._save_timer.start()
 
     def showEvent(self, event):
         super().showEvent(event)
-        if self.images and 0 <= self.current_image < len(self.images):
+        # Re-show once the first layout has sized the label; later show/hide
+        # toggles keep the pixmap already on the label
+        if not self._initial_show_done and self.images and 0 <= self.current_image < len(self.images):
+            self._initial_show_done = True
             QTimer.singleShot(100, self.show_current_image)
 
+    def closeEvent(self, event):
+        self._save_timer.stop()
+        self.update_screen_number()
+        self._do_save_config()
+        super().closeEvent(event)
+
     def moveEvent(self, event):
         super().moveEvent(event)
-        self.save_config()
+        if (self.pos() - self._last_screen_check_pos).manhattanLength() > SCREEN_CHECK_DISTANCE:
+            self.update_screen_number()
+        self._save_timer.start()
 
     def update_image_display(self):
+        if self.image_label.size() == self._last_label_size:
+            # The layout absorbed the resize; the label already shows this size
+            return
         if self.images and 0 <= self.current_image < len(self.images):
+            self._rescale_to_label()
+
+    def _finish_resize(self):
+        self._resizing = False
+        self.update_image_display()
+
+    def _rescale_to_label(self):
+        if self._source_path is None:
+            return
+        if self._source_qimage is None:
+            self._source_qimage = self.image_label.pixmap().toImage()
+        source = self._source_qimage
+        target = source.size().scaled(self.image_label.size(), Qt.KeepAspectRatio)
+        if target.width() > source.width() and not self._resizing:
+            # Decoded smaller than the label now is; upscaling would blur, so read it again
             self.show_current_image()
+            return
+        if self._resizing:
+            mode = Qt.FastTransformation
+            self._last_label_size = None
+        else:
+            mode = Qt.SmoothTransformation
+            self._last_label_size = self.image_label.size()
+        scaled = source.scaled(target, Qt.IgnoreAspectRatio, mode)
+        self.image_label.setPixmap(QPixmap.fromImage(scaled))
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)